@@ -712,14 +712,13 @@ class PrinterPolling:
 
         silent, normal = PrintInfo(), PrintInfo()
         for match in matches:
-            groups = match.groupdict()
             info = PrintInfo()
-            info.progress = int(groups["progress"])
+            info.progress = int(match.group("progress"))
             # Convert both time values to seconds and adjust by print speed
-            secs_remaining_unadjusted = int(groups["remaining"]) * 60
+            secs_remaining_unadjusted = int(match.group("remaining")) * 60
             info.remaining = self._speed_adjust_time_value(
                 secs_remaining_unadjusted)
-            secs_change_in_unadjusted = int(groups["change_in"]) * 60
+            secs_change_in_unadjusted = int(match.group("change_in")) * 60
             info.filament_change_in = self._speed_adjust_time_value(
                 secs_change_in_unadjusted)
 
@@ -728,9 +727,10 @@ class PrinterPolling:
             except ValueError:
                 pass
 
-            if match.group("mode") == PrintMode.SILENT.value:
+            mode = match.group("mode")
+            if mode == PrintMode.SILENT.value:
                 silent = info
-            elif match.group("mode") == PrintMode.NORMAL.value:
+            elif mode == PrintMode.NORMAL.value:
                 normal = info
 
         use_normal = False
@@ -3,7 +3,7 @@ import logging
 import re
 from collections import deque
 from threading import Event, RLock, Thread, Timer
-from typing import Dict, Optional, Union
+from typing import Dict, Optional, Tuple, Union
 
 from blinker import Signal  # type: ignore
 from prusa.connect.printer import Printer
@@ -27,6 +27,37 @@ from .structures.regular_expressions import (ATTENTION_REASON_REGEX,
 
 log = logging.getLogger(__name__)
 
+# Marks a state missing from the expected state change,
+# as the expected source itself is allowed to be None
+_MISSING = object()
+
+StatePairs = Tuple[Tuple[State, Union[Source, None]], ...]
+
+
+def _find_source(state_pairs: StatePairs, state: State):
+    """
+    Looks up the source paired with the given state
+    :return: the source, or _MISSING if the state is not among the pairs
+    """
+    for paired_state, source in state_pairs:
+        if paired_state is state:
+            return source
+    return _MISSING
+
+
+def _ignore_args(func):
+    """
+    Adapts a method taking no arguments to the signature of
+    the serial output handlers
+    """
+
+    # pylint: disable=unused-argument
+    def handler(sender, match):
+        """Throws away the sender and match"""
+        func()
+
+    return handler
+
 
 class StateChange:
     """
@@ -34,6 +65,9 @@ class StateChange:
     Used for assigning info to observed state changes
     """
 
+    __slots__ = ("to_states", "from_states", "command_id", "default_source",
+                 "reason", "ready")
+
     # pylint: disable=too-many-arguments
     def __init__(self,
                  command_id=None,
@@ -44,13 +78,12 @@ class StateChange:
                  ready: bool = False):
 
         self.reason = reason
-        self.to_states: Dict[State, Union[Source, None]] = {}
-        self.from_states: Dict[State, Union[Source, None]] = {}
-
-        if from_states is not None:
-            self.from_states = from_states
-        if to_states is not None:
-            self.to_states = to_states
+        # There are only a few states in each, so they're kept as pairs
+        # to be scanned through, which beats hashing the enum each time
+        self.to_states: StatePairs = \
+            tuple(to_states.items()) if to_states else ()
+        self.from_states: StatePairs = \
+            tuple(from_states.items()) if from_states else ()
 
         self.command_id = command_id
         self.default_source = default_source
@@ -70,21 +103,25 @@ def state_influencer(state_change: Optional[StateChange] = None):
 
         def wrapper(self, *args, **kwargs):
             """By nesting function definitions. Shut up Travis!"""
+            # The lock is already held, so the expected change is set
+            # and reset directly, not through expect_change()
+            # and stop_expecting_change(), which would just re-acquire it
             with self.state_lock:
                 has_set_expected_change = False
                 if self.expected_state_change is None and \
                         state_change is not None:
                     has_set_expected_change = True
-                    self.expect_change(state_change)
+                    self.expected_state_change = state_change
 
                 else:
                     log.debug("Default expected state change is overridden")
 
                 func(self, *args, **kwargs)
+                self._update_effective_state()
                 self.state_may_have_changed()
 
                 if has_set_expected_change:
-                    self.stop_expecting_change()
+                    self.expected_state_change = None
 
         return wrapper
 
@@ -97,6 +134,20 @@ class StateManager(metaclass=MCSingleton):
     to other PrusaLink components
     """
 
+    # The ones read on every state change go first
+    __slots__ = ("expected_state_change", "data", "state_lock",
+                 "pre_state_change_signal", "state_changed_signal",
+                 "post_state_change_signal", "send_pre_state_change",
+                 "send_state_changed", "send_post_state_change",
+                 "believe_not_printing",
+                 "combined_handlers", "combined_regex",
+                 "decoupled_fan_error_resolver", "serial_parser", "model",
+                 "sdk_printer", "cfg", "settings", "pause_signal",
+                 "fan_error_name", "resuming_from_fan_error",
+                 "unsure_whether_printing", "error_reason_thread",
+                 "error_reason_event", "tm_ignore_pause",
+                 "attention_clearing_timer", "__weakref__")
+
     # pylint: disable=too-many-instance-attributes,
     # pylint: disable=too-many-public-methods
     # pylint: disable=too-many-arguments
@@ -119,6 +170,11 @@ class StateManager(metaclass=MCSingleton):
         #                                           reason: str
         #                                           ready: bool
 
+        # Sent on every state change, look the send methods up only once
+        self.send_pre_state_change = self.pre_state_change_signal.send
+        self.send_state_changed = self.state_changed_signal.send
+        self.send_post_state_change = self.post_state_change_signal.send
+
         self.pause_signal = Signal()
 
         self.model.state_manager = StateManagerData(
@@ -126,6 +182,7 @@ class StateManager(metaclass=MCSingleton):
             base_state=State.BUSY,
             printing_state=None,
             override_state=None,
+            effective_state=State.BUSY,
             # Reported state history
             state_history=deque(maxlen=STATE_HISTORY_SIZE),
             last_state=State.BUSY,
@@ -182,21 +239,41 @@ class StateManager(metaclass=MCSingleton):
         # Let's clear it on a timer instead
         self.attention_clearing_timer = self.new_attention_timer()
 
+        # The fan error resolver gets connected and disconnected at runtime,
+        # keep the decoupled version, so it can be looked up for removal
+        self.decoupled_fan_error_resolver = self.serial_parser.decoupled(
+            self.fan_error_resolver)
+
+        # These are shared with other components. The serial parser calls
+        # only the handlers of the first matching regex, so they have to
+        # stay registered on their own
         regex_handlers = {
-            BUSY_REGEX: lambda sender, match: self.busy(),
-            ATTENTION_REGEX: lambda sender, match: self.attention(),
-            PAUSED_REGEX: lambda sender, match: self.filter_pause_events(),
-            RESUMED_REGEX: lambda sender, match: self.resumed(),
-            CANCEL_REGEX: lambda sender, match: self.stopped_or_not_printing(),
-            ERROR_REGEX: lambda sender, match: self.error_handler(),
+            BUSY_REGEX: _ignore_args(self.busy),
+            ATTENTION_REGEX: _ignore_args(self.attention),
+            RESUMED_REGEX: _ignore_args(self.resumed),
+            CANCEL_REGEX: _ignore_args(self.stopped_or_not_printing),
+        }
+
+        for regex, handler in regex_handlers.items():
+            self.serial_parser.add_decoupled_handler(regex, handler)
+
+        # Only we care about these, so they are joined into one
+        # alternation, matched once per line instead of once per regex.
+        # The named group wrapping each one tells us whose match it was
+        combined_handlers = {
+            PAUSED_REGEX: _ignore_args(self.filter_pause_events),
+            ERROR_REGEX: _ignore_args(self.error_handler),
             ERROR_REASON_REGEX: self.error_reason_handler,
             ATTENTION_REASON_REGEX: self.attention_reason_handler,
             FAN_ERROR_REGEX: self.fan_error,
             TM_ERROR_CLEARED: self.clear_tm_error
         }
-
-        for regex, handler in regex_handlers.items():
-            self.serial_parser.add_decoupled_handler(regex, handler)
+        self.combined_handlers = tuple(combined_handlers.values())
+        self.combined_regex = re.compile("|".join(
+            f"(?P<h{index}>{regex.pattern})"
+            for index, regex in enumerate(combined_handlers)))
+        self.serial_parser.add_decoupled_handler(self.combined_regex,
+                                                 self.combined_handler)
 
         for state in SERIAL:
             state.add_broke_handler(self.link_error_detected)
@@ -255,16 +332,25 @@ class StateManager(metaclass=MCSingleton):
             self.printing()
 
     def get_state(self):
+        """
+        Returns the effective state, resolved each time the internal
+        state gets influenced
+        """
+        return self.data.effective_state
+
+    def _update_effective_state(self):
         """
         State manager has three levels of importance, the most important state
-        is the one returned. The least important is the base state,
+        is the effective one. The least important is the base state,
         followed by printing state and then the override state.
         """
-        if self.data.override_state is not None:
-            return self.data.override_state
-        if self.data.printing_state is not None:
-            return self.data.printing_state
-        return self.data.base_state
+        data = self.data
+        if data.override_state is not None:
+            data.effective_state = data.override_state
+        elif data.printing_state is not None:
+            data.effective_state = data.printing_state
+        else:
+            data.effective_state = data.base_state
 
     def expect_change(self, change: StateChange):
         """
@@ -279,65 +365,46 @@ class StateManager(metaclass=MCSingleton):
         with self.state_lock:
             self.expected_state_change = None
 
-    def is_expected(self):
-        """Figure out if the state change we are experiencing was expected"""
-        with self.state_lock:
-            state_change = self.expected_state_change
-            expecting_change = state_change is not None
-            if expecting_change:
-                # flake8: noqa
-                expected_to = self.data.current_state in state_change.to_states
-                expected_from = self.data.last_state in state_change.from_states
-                has_default_source = state_change.default_source is not None
-                return expected_to or expected_from or has_default_source
-            return False
-
-    def get_expected_source(self):
-        """
-        Figures out who or what could have caused the state change
-        :return:
+    def _evaluate_expected_change(self):
         """
-        with self.state_lock:
-            # No change expected,
-            if self.expected_state_change is None:
-                return None
+        Looks up the observed transition in the expected state change,
+        going through each of its state pairs only once
+        :return: a tuple of whether the change was expected and its source
+        """
+        state_change = self.expected_state_change
+        # No change expected,
+        if state_change is None:
+            return False, None
 
-            state_change = self.expected_state_change
+        # Get the expected sources
+        data = self.data
+        source_from = _find_source(state_change.from_states, data.last_state)
+        source_to = _find_source(state_change.to_states, data.current_state)
+        expected = (source_from is not _MISSING or source_to is not _MISSING
+                    or state_change.default_source is not None)
+        if not expected:
+            return False, None
 
-            # Get the expected sources
+        if source_from is _MISSING:
             source_from = None
+        if source_to is _MISSING:
             source_to = None
-            if self.data.last_state in state_change.from_states:
-                source_from = state_change.from_states[self.data.last_state]
-            if self.data.current_state in state_change.to_states:
-                source_to = state_change.to_states[self.data.current_state]
-
-            # If there are conflicting sources, pick the one, paired with
-            # from_state as this is useful for leaving states like
-            # ATTENTION and ERROR
-            if (source_from is not None and source_to is not None
-                    and source_to != source_from):
-                source = source_from
-            else:
-                # no conflict here, the sources are the same,
-                # or one or both of them are None
-                try:
-                    # make a list throwing out Nones and get the next item
-                    # (the first one)
-                    source = next(item for item in [source_from, source_to]
-                                  if item is not None)
-                except StopIteration:  # tried to get next from an empty list
-                    source = None
-
-            if source is None:
-                source = state_change.default_source
-
-            log.debug(
-                "Source has been determined to be %s. Default was: %s, "
-                "from: %s, to: %s", source, state_change.default_source,
-                source_from, source_to)
 
-            return source
+        # If there are conflicting sources, pick the one, paired with
+        # from_state as this is useful for leaving states like
+        # ATTENTION and ERROR. With no conflict, the sources are the same,
+        # or one or both of them are None, so take the first one set
+        source = source_from if source_from is not None else source_to
+
+        if source is None:
+            source = state_change.default_source
+
+        log.debug(
+            "Source has been determined to be %s. Default was: %s, "
+            "from: %s, to: %s", source, state_change.default_source,
+            source_from, source_to)
+
+        return expected, source
 
     def state_may_have_changed(self):
         """
@@ -346,15 +413,18 @@ class StateManager(metaclass=MCSingleton):
         history and lets everyone know the state change details.
         """
         with self.state_lock:
+            data = self.data
+            new_state = data.effective_state
+            current_state = data.current_state
             # Did our internal state change cause a reported state change?
             # If yes, update state stuff
-            if self.get_state() != self.data.current_state:
+            if new_state != current_state:
                 self.believe_not_printing = False
-                self.data.last_state = self.data.current_state
-                self.data.current_state = self.get_state()
-                self.data.state_history.append(self.data.current_state)
-                log.debug("Changing state from %s to %s", self.data.last_state,
-                          self.data.current_state)
+                data.last_state = current_state
+                data.current_state = new_state
+                data.state_history.append(new_state)
+                log.debug("Changing state from %s to %s", current_state,
+                          new_state)
 
                 # Now let's find out if the state change was expected
                 # and what parameters can we deduce from that
@@ -363,39 +433,44 @@ class StateManager(metaclass=MCSingleton):
                 reason = None
                 ready = False
 
-                if self.data.printing_state is not None:
-                    log.debug("We are printing - %s", self.data.printing_state)
+                if data.printing_state is not None:
+                    log.debug("We are printing - %s", data.printing_state)
 
-                if self.data.override_state is not None:
+                if data.override_state is not None:
                     log.debug("State is overridden by %s",
-                              self.data.override_state)
+                              data.override_state)
 
                 # If the state changed to something expected,
                 # then send the information about it
-                if self.is_expected():
-                    if self.expected_state_change.command_id is not None:
-                        command_id = self.expected_state_change.command_id
-                    source = self.get_expected_source()
-                    reason = self.expected_state_change.reason
-                    ready = self.expected_state_change.ready
+                expected, expected_source = self._evaluate_expected_change()
+                if expected:
+                    state_change = self.expected_state_change
+                    if state_change.command_id is not None:
+                        command_id = state_change.command_id
+                    source = expected_source
+                    reason = state_change.reason
+                    ready = state_change.ready
                     if reason is not None:
-                        log.debug("Reason for %s: %s", self.get_state(),
-                                  reason)
+                        log.debug("Reason for %s: %s", new_state, reason)
                 else:
                     log.debug("Unexpected state change. This is weird")
                 self.expected_state_change = None
 
-                self.pre_state_change_signal.send(self, command_id=command_id)
+                self.send_pre_state_change(self, command_id=command_id)
 
-                self.state_changed_signal.send(
+                self.send_state_changed(
                     self,
-                    from_state=self.data.last_state,
-                    to_state=self.data.current_state,
+                    from_state=current_state,
+                    to_state=new_state,
                     command_id=command_id,
                     source=source,
                     reason=reason,
                     ready=ready)
-                self.post_state_change_signal.send(self)
+                self.send_post_state_change(self)
+
+    def combined_handler(self, sender, match: re.Match):
+        """Calls the handler of the regex that matched the combined one"""
+        self.combined_handlers[int(match.lastgroup[1:])](sender, match)
 
     def fan_error(self, sender, match: re.Match):
         """
@@ -404,7 +479,8 @@ class StateManager(metaclass=MCSingleton):
         """
         assert sender is not None
         self.fan_error_name = match.group("fan_name")
-        self.serial_parser.add_decoupled_handler(FAN_REGEX, self.fan_error_resolver)
+        self.serial_parser.add_handler(FAN_REGEX,
+                                       self.decoupled_fan_error_resolver)
 
         log.debug("%s fan error has been observed.", self.fan_error_name)
         self.expect_change(
@@ -449,8 +525,8 @@ class StateManager(metaclass=MCSingleton):
     def _cancel_fan_error(self):
         """Removes the fan error"""
         self.fan_error_name = None
-        self.serial_parser.remove_handler(FAN_ERROR_REGEX,
-                                          self.fan_error_resolver)
+        self.serial_parser.remove_handler(FAN_REGEX,
+                                          self.decoupled_fan_error_resolver)
 
     def error_handler(self):
         """
@@ -602,13 +678,14 @@ class StateManager(metaclass=MCSingleton):
         :return:
         """
         log.debug("Should be PRINTING")
-        if self.data.printing_state is None or \
-                self.data.printing_state == State.PAUSED:
+        data = self.data
+        printing_state = data.printing_state
+        if printing_state is None or printing_state == State.PAUSED:
             self.unsure_whether_printing = False
-            self.data.printing_state = State.PRINTING
+            data.printing_state = State.PRINTING
         else:
             log.debug("Ignoring switch to PRINTING base: %s, printing: %s",
-                      self.data.base_state, self.data.printing_state)
+                      data.base_state, printing_state)
 
     @state_influencer(
         StateChange(from_states={
@@ -702,17 +779,18 @@ class StateManager(metaclass=MCSingleton):
         if self.unsure_whether_printing:
             return
 
-        if self.data.base_state == State.BUSY:
-            self.data.base_state = State.IDLE
+        data = self.data
+        if data.base_state == State.BUSY:
+            data.base_state = State.IDLE
 
-        if self.data.printing_state in {State.STOPPED, State.FINISHED} and \
-                self.data.override_state is not State.ATTENTION:
-            self.data.printing_state = None
+        if data.printing_state in {State.STOPPED, State.FINISHED} and \
+                data.override_state is not State.ATTENTION:
+            data.printing_state = None
 
             # Make sure that if we just finished a print, or we stopped one,
             # we return to IDLE
-            if self.data.base_state == State.READY:
-                self.data.base_state = State.IDLE
+            if data.base_state == State.READY:
+                data.base_state = State.IDLE
 
         self._clear_attention()
 
@@ -60,6 +60,8 @@ class StateManagerData(BaseModel):
     base_state: State
     printing_state: Optional[State]
     override_state: Optional[State]
+    # The most important one of the above, updated on every change
+    effective_state: State
 
     # Reported state history
     last_state: State
@@ -30,6 +30,8 @@ class RegexPairing:
 
     def __init__(self, regexp, priority=0) -> None:
         self.regexp: re.Pattern = regexp
+        # Bound once, so matching each line skips the attribute lookup
+        self.match: Callable[[str], Optional[Match]] = regexp.match
         self.signal: Signal = Signal()
         self.priority: Union[float, int] = priority
 
@@ -77,7 +79,7 @@ class SerialParser(metaclass=MCSingleton):
 
         with self.lock:
             for pairing in self.pattern_list:
-                match = pairing.regexp.match(line)
+                match = pairing.match(line)
                 if match:
                     chosen_pairing = pairing
                     break
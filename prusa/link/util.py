@@ -9,7 +9,7 @@ import typing
 from hashlib import sha256
 from pathlib import Path
 from threading import Event, current_thread
-from time import time
+from time import monotonic
 from typing import Callable, Union
 
 import prctl  # type: ignore
@@ -36,22 +36,21 @@ def loop_until(loop_evt: Event, run_every_sec: Callable[[], float], to_run,
     pass getters for arguments
     """
     prctl_name()
+    # Freeze the getters once, so each run only calls them
+    kwarg_items = tuple(kwarg_getters.items())
+    # Monotonic, so the schedule survives the system clock being stepped
+    next_run_at = monotonic()
     while not loop_evt.is_set():
         # if it's time to run the func
 
-        last_called = time()
-        args = []
-        for getter in arg_getters:
-            args.append(getter())
+        to_run(*[getter() for getter in arg_getters],
+               **{name: getter() for name, getter in kwarg_items})
 
-        kwargs = {}
-        for name, getter in kwarg_getters.items():
-            kwargs[name] = getter()
-
-        to_run(*args, **kwargs)
-
-        run_again_in = max(0.0, (last_called + run_every_sec()) - time())
-        loop_evt.wait(run_again_in)
+        # The one clock read per run tells us how long to wait, and when
+        # this run is over, also when the next one is going to start
+        now = monotonic()
+        next_run_at = max(now, next_run_at + run_every_sec())
+        loop_evt.wait(next_run_at - now)
 
 
 def get_local_ip():
@@ -60,12 +59,11 @@ def get_local_ip():
     Code from https://stackoverflow.com/a/166589
     Beware this throws socket errors
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    # does not matter if host is reachable or not,
-    # any client interface that is UP should suffice
-    sock.connect(("8.8.8.8", 1))
-    local_ip = sock.getsockname()[0]
-    sock.close()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        # does not matter if host is reachable or not,
+        # any client interface that is UP should suffice
+        sock.connect(("8.8.8.8", 1))
+        local_ip = sock.getsockname()[0]
     return local_ip
 
 
@@ -75,11 +73,11 @@ def get_local_ip6():
     Code from https://stackoverflow.com/a/166589
     Beware this throws socket errors
     """
-    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-    # does not matter if host is reachable or not,
-    # any client interface that is UP should suffice
-    sock.connect(("2606:4700:4700::1111", 1))
-    local_ip = sock.getsockname()[0]
+    with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+        # does not matter if host is reachable or not,
+        # any client interface that is UP should suffice
+        sock.connect(("2606:4700:4700::1111", 1))
+        local_ip = sock.getsockname()[0]
     return local_ip
 
 
@@ -0,0 +1,126 @@
+"""Tests for the serial output handling of the state manager"""
+from unittest.mock import DEFAULT, Mock, patch
+
+import pytest
+
+from prusa.link.printer_adapter.model import Model  # type:ignore
+from prusa.link.printer_adapter.state_manager import (  # type:ignore
+    StateManager,
+)
+from prusa.link.printer_adapter.structures.regular_expressions import (  # type:ignore
+    FAN_REGEX,
+)
+from prusa.link.serial.serial_parser import SerialParser  # type:ignore
+
+# pylint: disable=protected-access
+# pylint: disable=redefined-outer-name
+
+FAN_ERROR_LINE = "Print fan speed is lower than expected"
+FAN_LINE = "E0:0 RPM PRN1:0 RPM E0@:0 PRN1@:0"
+
+# A sample line for each handler of the combined regex
+COMBINED_LINES = {
+    "filter_pause_events": "// action:paused",
+    "error_handler": "Error:Printer halted. kill() called!",
+    "error_reason_handler":
+        "Error:0: Heaters switched off. MINTEMP BED triggered!",
+    "attention_reason_handler": "TM: error triggered!",
+    "fan_error": FAN_ERROR_LINE,
+    "clear_tm_error": "TM: error cleared",
+}
+
+
+class CoupledSerialParser(SerialParser):
+    """
+    Wraps handlers the same way the ThreadedSerialParser does, but calls
+    them right away instead of enqueuing them for the decoupling thread
+    """
+
+    def decoupled(self, handler):
+        """Returns a new wrapper calling the handler, like the original"""
+        def inner(sender, match):
+            handler(sender, match=match)
+        return inner
+
+    def add_decoupled_handler(self, regexp, handler, priority=0):
+        """Adds the wrapped handler"""
+        self.add_handler(regexp, self.decoupled(handler), priority)
+
+
+@pytest.fixture
+def parser():
+    """Provides the parser, cleans up the singletons after the test"""
+    yield CoupledSerialParser()
+    CoupledSerialParser._MCSingleton__instance = None
+    StateManager._MCSingleton__instance = None
+    Model._MCSingleton__instance = None
+
+
+def get_state_manager(parser):
+    """Creates a state manager listening to the given parser"""
+    return StateManager(parser, Model(), Mock(), Mock(), Mock())
+
+
+def test_combined_dispatch(parser):
+    """Each line matched by the combined regex calls only its own handler"""
+    with patch.multiple(StateManager,
+                        **{name: DEFAULT for name in COMBINED_LINES}) as mocks:
+        get_state_manager(parser)
+
+        calls = {}
+        for name, line in COMBINED_LINES.items():
+            for handler in mocks.values():
+                handler.reset_mock()
+            parser.decide(line)
+            for other_name, handler in mocks.items():
+                if other_name != name:
+                    handler.assert_not_called()
+            mocks[name].assert_called_once()
+            calls[name] = mocks[name].call_args
+
+        assert calls["filter_pause_events"].args == ()
+        assert calls["error_handler"].args == ()
+
+        match = calls["error_reason_handler"].args[1]
+        assert match.group("mintemp") == "IN"
+        assert match.group("bed") == "BED "
+        match = calls["attention_reason_handler"].args[1]
+        assert match.group("tm_error") == "TM: error triggered!"
+        assert match.group("mbl_too_high") is None
+        match = calls["fan_error"].args[1]
+        assert match.group("fan_name") == "Print"
+        match = calls["clear_tm_error"].args[1]
+        assert match.group(0) == "TM: error cleared"
+
+        # Shared regexes are not a part of the combined one
+        for handler in mocks.values():
+            handler.reset_mock()
+        parser.decide("echo:busy: processing")
+        for handler in mocks.values():
+            handler.assert_not_called()
+
+
+@pytest.mark.parametrize("cancel", ["resumed", "stopped"])
+def test_fan_error_resolver(parser, cancel):
+    """
+    The fan error resolver gets connected to FAN_REGEX only once,
+    and is removed from it again, leaving other handlers be
+    """
+    state_manager = get_state_manager(parser)
+    other_handler = Mock()
+    parser.add_handler(FAN_REGEX, other_handler)
+
+    parser.decide(FAN_ERROR_LINE)
+    parser.decide(FAN_ERROR_LINE)
+    state_manager.stop_attention_timer()
+    assert state_manager.fan_error_name == "Print"
+    pairing = parser.pairing_dict[FAN_REGEX]
+    assert len(pairing.signal.receivers) == 2
+
+    getattr(state_manager, cancel)()
+    state_manager.stop_attention_timer()
+    assert state_manager.fan_error_name is None
+    assert len(pairing.signal.receivers) == 1
+
+    parser.decide(FAN_LINE)
+    other_handler.assert_called_once()